@@ -1,6 +1,4 @@
-import math
-import random
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
 import numpy as np
 import struct
@@ -10,79 +8,201 @@ from PIL import Image
 Vertex = Tuple[float, float, float]
 Face = Tuple[Vertex, Vertex, Vertex]
 
+# Unit cube corners and the corner indices of its 12 triangles, two each for
+# the bottom, top, front, right, back and left side.
+CUBE_CORNERS = np.array([
+    [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+    [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1],
+], dtype=np.float32)
+CUBE_FACES = np.array([
+    [0, 3, 1], [1, 3, 2],
+    [4, 5, 7], [5, 6, 7],
+    [0, 1, 4], [1, 5, 4],
+    [1, 2, 5], [2, 6, 5],
+    [2, 3, 6], [3, 7, 6],
+    [3, 0, 7], [0, 4, 7],
+], dtype=np.intp)
+
+# A heightfield wall from corner edge A to corner edge B, each edge given by
+# four ascending points (0-3 on A, 4-7 on B): a fan of three triangles up A,
+# then three across the top of B. Triangles over repeated points are dropped.
+WALL_FACES = np.array([
+    [0, 4, 1], [1, 4, 2], [2, 4, 3],
+    [3, 4, 5], [3, 5, 6], [3, 6, 7],
+], dtype=np.intp)
+
+# Unit square pyramid: base corners and apex, two base and four side triangles.
+PYRAMID_CORNERS = np.array([
+    [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [0.5, 0.5, 1],
+], dtype=np.float32)
+PYRAMID_FACES = np.array([
+    [0, 1, 2], [0, 2, 3],
+    [0, 1, 4], [1, 2, 4],
+    [2, 3, 4], [3, 0, 4],
+], dtype=np.intp)
+
+# One 50-byte binary STL triangle: normal, three vertices, attribute count.
+STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+STL_COUNT = struct.Struct("<I")
+
 def create_cube(x: float, y: float, z: float, size: float, height: float) -> List[Face]:
-    p = [
-        (x, y, z),
-        (x + size, y, z),
-        (x + size, y + size, z),
-        (x, y + size, z),
-        (x, y, z + height),
-        (x + size, y, z + height),
-        (x + size, y + size, z + height),
-        (x, y + size, z + height),
-    ]
-    return [
-        (p[0], p[3], p[1]), (p[1], p[3], p[2]),
-        (p[4], p[5], p[7]), (p[5], p[6], p[7]),
-        (p[0], p[1], p[4]), (p[1], p[5], p[4]),
-        (p[1], p[2], p[5]), (p[2], p[6], p[5]),
-        (p[2], p[3], p[6]), (p[3], p[7], p[6]),
-        (p[3], p[0], p[7]), (p[0], p[4], p[7]),
-    ]
+    cube = build_boxes(np.array([x]), np.array([y]), z, z + height, size, dtype=np.float64)[0]
+    return [tuple(map(tuple, face)) for face in cube.tolist()]
+
+def build_shapes(corners: np.ndarray, faces: np.ndarray, x: np.ndarray, y: np.ndarray,
+                 z0, z1, size: float, dtype=np.float32) -> np.ndarray:
+    """Copies of a unit shape scaled to size x size x (z1 - z0) at each (x, y, z0).
+
+    ``corners`` are the unit shape's vertices and ``faces`` index them; the
+    triangles of all copies are returned as (N, F, 3, 3) of ``dtype``, float32
+    for the bulk builders feeding the STL writer.
+    """
+    x, y, z0, z1 = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (x, y, z0, z1)))
+    origin = np.stack([x, y, z0], axis=-1)
+    scale = np.stack([np.full_like(x, size), np.full_like(x, size), z1 - z0], axis=-1)
+    points = origin[:, None, :] + corners * scale[:, None, :]
+    return points.astype(dtype, copy=False)[:, faces]
+
+def build_boxes(x: np.ndarray, y: np.ndarray, z0, z1, size: float, faces: np.ndarray = CUBE_FACES,
+                dtype=np.float32) -> np.ndarray:
+    """Triangles ``faces`` of boxes spanning z0..z1 over each (x, y) cell, returns (N, F, 3, 3)."""
+    return build_shapes(CUBE_CORNERS, faces, x, y, z0, z1, size, dtype)
+
+def build_cubes(x: np.ndarray, y: np.ndarray, size: float, heights: np.ndarray) -> np.ndarray:
+    """Vectorized create_cube for many cubes at z=0, returns (N, 12, 3, 3)."""
+    return build_boxes(x, y, 0.0, heights, size)
+
+def _wall_faces(ax: np.ndarray, ay: np.ndarray, za: np.ndarray,
+                bx: np.ndarray, by: np.ndarray, zb: np.ndarray) -> np.ndarray:
+    """Walls between vertical edges A and B with (N, 4) ascending heights each."""
+    a = np.stack([np.broadcast_to(ax[:, None], za.shape), np.broadcast_to(ay[:, None], za.shape), za], axis=-1)
+    b = np.stack([np.broadcast_to(bx[:, None], zb.shape), np.broadcast_to(by[:, None], zb.shape), zb], axis=-1)
+    faces = np.concatenate([a, b], axis=1)[:, WALL_FACES]
+    keep = np.concatenate([za[:, 1:] > za[:, :-1], zb[:, 1:] > zb[:, :-1]], axis=1)
+    return faces[keep]
+
+def build_heightfield(heights: np.ndarray, origin: float, size: float) -> np.ndarray:
+    """Relief mesh for an (R, R) height grid indexed [i, j], 0 marks empty cells.
+
+    Instead of one cube per cell only the top and bottom of each cell are
+    emitted, plus side walls where neighbouring heights differ, so walls
+    shared by two cells are neither duplicated nor hidden inside the solid.
+    The vertical wall edges are split at the heights of all cells meeting
+    at that corner, so every edge is shared by two triangles and the mesh
+    stays closed.
+    """
+    n = heights.shape[0]
+    h = np.pad(heights, 1)
+    grid = np.arange(n + 1) * size + origin
+    # heights of the four cells around each grid vertex (vi, vj)
+    around = np.stack([h[:-1, :-1], h[1:, :-1], h[:-1, 1:], h[1:, 1:]], axis=-1)
+    parts = []
+
+    i, j = np.nonzero(heights > 0)
+    quad = np.stack([
+        np.stack([grid[i], grid[j]], axis=-1), np.stack([grid[i + 1], grid[j]], axis=-1),
+        np.stack([grid[i + 1], grid[j + 1]], axis=-1), np.stack([grid[i], grid[j + 1]], axis=-1),
+    ], axis=1)
+    for z, faces in ((heights[i, j], [[0, 1, 3], [1, 2, 3]]), (np.zeros(len(i)), [[0, 3, 1], [1, 3, 2]])):
+        corners = np.concatenate([quad, np.broadcast_to(z[:, None, None], (len(i), 4, 1))], axis=-1)
+        parts.append(corners[:, faces].reshape(-1, 3, 3))
+
+    # Each wall belongs to the taller of its two cells and runs from grid
+    # vertex A to B, ordered so its outward side faces the lower cell.
+    walls = []
+    a, b = h[:-1, 1:-1], h[1:, 1:-1]  # across x at vertex column k, rows j..j + 1
+    k, j = np.nonzero(a > b)
+    walls.append((k, j, k, j + 1, b[k, j], a[k, j]))
+    k, j = np.nonzero(b > a)
+    walls.append((k, j + 1, k, j, a[k, j], b[k, j]))
+    a, b = h[1:-1, :-1], h[1:-1, 1:]  # across y at vertex row k, columns i..i + 1
+    i, k = np.nonzero(a > b)
+    walls.append((i + 1, k, i, k, b[i, k], a[i, k]))
+    i, k = np.nonzero(b > a)
+    walls.append((i, k, i + 1, k, a[i, k], b[i, k]))
+    for avi, avj, bvi, bvj, lo, hi in walls:
+        za = np.sort(np.clip(around[avi, avj], lo[:, None], hi[:, None]), axis=1)
+        zb = np.sort(np.clip(around[bvi, bvj], lo[:, None], hi[:, None]), axis=1)
+        parts.append(_wall_faces(grid[avi], grid[avj], za, grid[bvi], grid[bvj], zb))
+
+    return np.concatenate(parts).astype(np.float32)
 
 def create_pyramid(x: float, y: float, z: float, size: float, height: float) -> List[Face]:
-    base = [
-        (x, y, z),
-        (x + size, y, z),
-        (x + size, y + size, z),
-        (x, y + size, z),
-    ]
-    apex = (x + size / 2, y + size / 2, z + height)
-    return [
-        (base[0], base[1], base[2]), (base[0], base[2], base[3]),
-        (base[0], base[1], apex), (base[1], base[2], apex),
-        (base[2], base[3], apex), (base[3], base[0], apex),
-    ]
+    pyramid = build_shapes(PYRAMID_CORNERS, PYRAMID_FACES, np.array([x]), np.array([y]), z, z + height, size,
+                           dtype=np.float64)[0]
+    return [tuple(map(tuple, face)) for face in pyramid.tolist()]
+
+def build_pyramids(x: np.ndarray, y: np.ndarray, size: float, heights: np.ndarray) -> np.ndarray:
+    """Vectorized create_pyramid for many pyramids at z=0, returns (N, 6, 3, 3)."""
+    return build_shapes(PYRAMID_CORNERS, PYRAMID_FACES, x, y, 0.0, heights, size)
 
 def create_cylinder(x: float, y: float, z: float, size: float, height: float, segments: int = 12) -> List[Face]:
-    radius = size / 2
-    cx = x + radius
-    cy = y + radius
-    faces: List[Face] = []
-    for i in range(segments):
-        a1 = 2 * math.pi * i / segments
-        a2 = 2 * math.pi * (i + 1) / segments
-        p1 = (cx + radius * math.cos(a1), cy + radius * math.sin(a1), z)
-        p2 = (cx + radius * math.cos(a2), cy + radius * math.sin(a2), z)
-        p1_top = (p1[0], p1[1], z + height)
-        p2_top = (p2[0], p2[1], z + height)
-        faces.append(((cx, cy, z), p2, p1))
-        faces.append(((cx, cy, z + height), p1_top, p2_top))
-        faces.append((p1, p2, p1_top))
-        faces.append((p2, p2_top, p1_top))
-    return faces
-
-def _normal(v1: Vertex, v2: Vertex, v3: Vertex) -> Tuple[float, float, float]:
-    ux, uy, uz = (v2[0] - v1[0], v2[1] - v1[1], v2[2] - v1[2])
-    vx, vy, vz = (v3[0] - v1[0], v3[1] - v1[1], v3[2] - v1[2])
-    nx = uy * vz - uz * vy
-    ny = uz * vx - ux * vz
-    nz = ux * vy - uy * vx
-    length = math.sqrt(nx * nx + ny * ny + nz * nz) or 1.0
-    return nx / length, ny / length, nz / length
-
-
-def write_binary_stl(faces: List[Face], filename: str) -> None:
+    corners, faces = cylinder_table(segments)
+    cylinder = build_shapes(corners, faces, np.array([x]), np.array([y]), z, z + height, size,
+                            dtype=np.float64)[0]
+    return [tuple(map(tuple, face)) for face in cylinder.tolist()]
+
+# cos/sin of the segments + 1 ring angles, keyed by segment count
+_CYL_TRIG = {}
+
+def _get_trig(segments: int) -> Tuple[np.ndarray, np.ndarray]:
+    if segments not in _CYL_TRIG:
+        a = 2 * np.pi * np.arange(segments + 1) / segments
+        _CYL_TRIG[segments] = np.cos(a), np.sin(a)
+    return _CYL_TRIG[segments]
+
+def cylinder_table(segments: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Unit corners and faces of a cylinder, triangles in create_cylinder's order."""
+    cos, sin = _get_trig(segments)
+    ring = np.stack([0.5 + 0.5 * cos, 0.5 + 0.5 * sin], axis=-1)
+    corners = np.concatenate([
+        [[0.5, 0.5, 0.0], [0.5, 0.5, 1.0]],
+        np.column_stack([ring, np.zeros(segments + 1)]),
+        np.column_stack([ring, np.ones(segments + 1)]),
+    ])
+    i = np.arange(segments)
+    p1, p2 = 2 + i, 3 + i
+    p1_top, p2_top = p1 + segments + 1, p2 + segments + 1
+    faces = np.stack([
+        np.stack([np.zeros_like(i), p2, p1], axis=-1),
+        np.stack([np.ones_like(i), p1_top, p2_top], axis=-1),
+        np.stack([p1, p2, p1_top], axis=-1),
+        np.stack([p2, p2_top, p1_top], axis=-1),
+    ], axis=1).reshape(-1, 3)
+    return corners, faces
+
+def build_cylinders(x: np.ndarray, y: np.ndarray, size: float, heights: np.ndarray,
+                    segments: int = 12) -> np.ndarray:
+    """Vectorized create_cylinder for many cylinders at z=0, returns (N, 4 * segments, 3, 3)."""
+    corners, faces = cylinder_table(segments)
+    return build_shapes(corners, faces, x, y, 0.0, heights, size)
+
+def face_normals(verts: np.ndarray) -> np.ndarray:
+    """Unit normals of an (N, 3, 3) vertex array, zero for degenerate faces."""
+    n = np.cross(verts[:, 1] - verts[:, 0], verts[:, 2] - verts[:, 0])
+    n /= np.linalg.norm(n, axis=1, keepdims=True).clip(min=1e-30)
+    return n
+
+
+def write_binary_stl(faces: Union[List[Face], np.ndarray], filename: str, chunk_size: int = 65536,
+                     header: bytes = b"Created by disk_shadow_generator") -> None:
+    """Write faces as binary STL, streamed through one reused record buffer.
+
+    At most ``chunk_size`` triangles are converted at a time, so no full
+    size normal or record copy of a large mesh is ever held in memory.
+    ``header`` is padded to the 80 header bytes.
+    """
+    verts = np.asarray(faces, dtype=np.float32).reshape(-1, 3, 3)
+    records = np.zeros(min(len(verts), chunk_size), dtype=STL_RECORD)
     with open(filename, "wb") as f:
-        header = b"Created by disk_shadow_generator".ljust(80, b" ")
-        f.write(header)
-        f.write(len(faces).to_bytes(4, byteorder="little"))
-        for v1, v2, v3 in faces:
-            nx, ny, nz = _normal(v1, v2, v3)
-            f.write(struct.pack("<3f", nx, ny, nz))
-            for v in (v1, v2, v3):
-                f.write(struct.pack("<3f", *v))
-            f.write((0).to_bytes(2, byteorder="little"))
+        f.write(header[:80].ljust(80, b" "))
+        f.write(STL_COUNT.pack(len(verts)))
+        for start in range(0, len(verts), chunk_size):
+            block = verts[start:start + chunk_size]
+            out = records[:len(block)]
+            out["vertices"] = block
+            out["normal"] = face_normals(block)
+            f.write(memoryview(out).cast("B"))
 
 def image_to_shadow_disk(
     image_path: str,
@@ -97,28 +217,38 @@ def image_to_shadow_disk(
     img = Image.open(image_path).convert("L")
     img = img.resize((resolution, resolution))
     pixels = np.array(img)
-    pixels = 255 - pixels
+    # dark pixels get the full relief, computed once for the whole image
+    h_grid = base_thickness + (1.0 - pixels.astype(np.float32) * (1.0 / 255.0)) * max_relief
 
     pixel_size = 2 * outer_radius / resolution
-    faces: List[Face] = []
-    for i in range(resolution):
-        x = i * pixel_size - outer_radius
-        for j in range(resolution):
-            y = j * pixel_size - outer_radius
-            r = math.hypot(x + pixel_size / 2, y + pixel_size / 2)
-            if hole_radius <= r <= outer_radius:
-                h = base_thickness + (pixels[j, i] / 255.0) * max_relief
-                shape_sel = shape
-                if shape == "mixed":
-                    shape_sel = random.choice(["cube", "cylinder", "pyramid"])
-                if shape_sel == "cube":
-                    faces.extend(create_cube(x, y, 0.0, pixel_size, h))
-                elif shape_sel == "cylinder":
-                    faces.extend(create_cylinder(x, y, 0.0, pixel_size, h))
-                elif shape_sel == "pyramid":
-                    faces.extend(create_pyramid(x, y, 0.0, pixel_size, h))
-                else:
-                    raise ValueError(f"Unknown shape type: {shape_sel}")
+    coords = np.arange(resolution) * pixel_size - outer_radius
+    centers = coords + pixel_size / 2
+    r2 = centers[:, None] ** 2 + centers[None, :] ** 2
+    mask = (r2 >= hole_radius ** 2) & (r2 <= outer_radius ** 2)
+    # h_grid is indexed [row, column] = [j, i] while the grid is [i, j]
+    heights = h_grid.T[mask]
+
+    if shape == "cube":
+        grid = np.zeros((resolution, resolution))
+        grid[mask] = heights
+        faces = build_heightfield(grid, -outer_radius, pixel_size)
+    else:
+        x, y = np.meshgrid(coords, coords, indexing="ij")
+        x, y = x[mask], y[mask]
+        builders = {"cube": build_cubes, "cylinder": build_cylinders, "pyramid": build_pyramids}
+        if shape == "mixed":
+            names = list(builders)
+            choice = np.random.randint(len(names), size=len(heights))
+        elif shape in builders:
+            names = [shape]
+            choice = np.zeros(len(heights), dtype=int)
+        else:
+            raise ValueError(f"Unknown shape type: {shape}")
+        parts = []
+        for n, name in enumerate(names):
+            sel = choice == n
+            parts.append(builders[name](x[sel], y[sel], pixel_size, heights[sel]).reshape(-1, 3, 3))
+        faces = np.concatenate(parts)
     write_binary_stl(faces, output_path)
     print(f"STL saved to {output_path}")
 
@@ -1,108 +1,531 @@
 import math
-import struct
-from typing import Tuple, List
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Tuple, Union
 
 import numpy as np
 from PIL import Image
 
+from disk_shadow_stl_generator import STL_RECORD
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:  # numba is optional, the NumPy kernels are used instead
+    HAVE_NUMBA = False
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+    prange = range
+
+try:
+    # whether a device is present is only checked once --gpu asks for it,
+    # so importing does not initialise the CUDA driver
+    from numba import cuda
+    HAVE_CUDA = True
+except ImportError:
+    HAVE_CUDA = False
+
 Vector = np.ndarray
 Triangle = Tuple[Vector, Vector, Vector]
+Triangles = Union[List[Triangle], np.ndarray]
+
+# fastmath without "nnan"/"ninf": misses are reported as math.inf.
+_FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+# CUDA launches use _CUDA_BLOCK x _CUDA_BLOCK threads, one triangle per thread in a tile.
+_CUDA_BLOCK = 16
+_CUDA_TILE = _CUDA_BLOCK * _CUDA_BLOCK
+
+
+class Grid(NamedTuple):
+    """Uniform xy grid over a triangle array, bucketed in CSR form.
 
-def load_binary_stl(filename: str) -> List[Triangle]:
+    Triangles ``items[start[c]:start[c + 1]]`` overlap cell ``c = ix * ny + iy``.
+    """
+    lo: np.ndarray     # (3,) padded bounding box of the mesh
+    hi: np.ndarray     # (3,)
+    cell: np.ndarray   # (2,) cell size along x and y
+    dims: np.ndarray   # (2,) number of cells nx, ny
+    start: np.ndarray  # (nx * ny + 1,)
+    items: np.ndarray  # triangle indices
+
+def load_binary_stl(filename: str) -> np.ndarray:
+    """Read the triangles of a binary STL as a (T, 3, 3) array."""
     with open(filename, 'rb') as f:
-        f.read(80)  # header
-        count = struct.unpack('<I', f.read(4))[0]
-        tris = []
-        for _ in range(count):
-            data = struct.unpack('<12fH', f.read(50))
-            v1 = np.array(data[3:6])
-            v2 = np.array(data[6:9])
-            v3 = np.array(data[9:12])
-            tris.append((v1, v2, v3))
-    return tris
+        f.seek(80)  # header
+        header = np.fromfile(f, dtype='<u4', count=1)
+        if len(header) != 1:
+            raise ValueError(f"{filename}: no triangle count, file is shorter than 84 bytes")
+        count = int(header[0])
+        records = np.fromfile(f, dtype=STL_RECORD, count=count)
+    if len(records) != count:
+        raise ValueError(f"{filename}: expected {count} triangles, found {len(records)}")
+    return records['vertices']
 
-def ray_triangle_intersect(orig: Vector, dir: Vector, tri: Triangle) -> float:
-    v0, v1, v2 = tri
-    eps = 1e-6
-    edge1 = v1 - v0
-    edge2 = v2 - v0
-    h = np.cross(dir, edge2)
-    a = np.dot(edge1, h)
+@njit(cache=True, fastmath=_FASTMATH)
+def _ray_triangle(ox: float, oy: float, oz: float, dx: float, dy: float, dz: float,
+                  v0x: float, v0y: float, v0z: float, v1x: float, v1y: float, v1z: float,
+                  v2x: float, v2y: float, v2z: float) -> float:
+    """Scalar Moeller-Trumbore test with the cross and dot products written out.
+
+    Triangles and rays are float32 so the arithmetic stays single precision.
+    """
+    eps = np.float32(1e-6)
+    e1x, e1y, e1z = v1x - v0x, v1y - v0y, v1z - v0z
+    e2x, e2y, e2z = v2x - v0x, v2y - v0y, v2z - v0z
+    hx = dy * e2z - dz * e2y
+    hy = dz * e2x - dx * e2z
+    hz = dx * e2y - dy * e2x
+    a = e1x * hx + e1y * hy + e1z * hz
     if -eps < a < eps:
         return math.inf
-    f = 1.0 / a
-    s = orig - v0
-    u = f * np.dot(s, h)
+    f = np.float32(1.0) / a
+    sx, sy, sz = ox - v0x, oy - v0y, oz - v0z
+    u = f * (sx * hx + sy * hy + sz * hz)
     if u < 0.0 or u > 1.0:
         return math.inf
-    q = np.cross(s, edge1)
-    v = f * np.dot(dir, q)
+    qx = sy * e1z - sz * e1y
+    qy = sz * e1x - sx * e1z
+    qz = sx * e1y - sy * e1x
+    v = f * (dx * qx + dy * qy + dz * qz)
     if v < 0.0 or u + v > 1.0:
         return math.inf
-    t = f * np.dot(edge2, q)
+    t = f * (e2x * qx + e2y * qy + e2z * qz)
     if t > eps:
         return t
     return math.inf
 
-def make_shadow_image(tris: List[Triangle], light: Vector, plane_z: float,
-                       size: float, resolution: int) -> Image.Image:
-    half = size / 2.0
-    img = np.zeros((resolution, resolution), dtype=np.uint8) + 255
-    for iy in range(resolution):
+@njit(cache=True, fastmath=_FASTMATH)
+def _intersect(ox: float, oy: float, oz: float, dx: float, dy: float, dz: float,
+               tris: np.ndarray, k: int) -> float:
+    return _ray_triangle(ox, oy, oz, dx, dy, dz,
+                         tris[k, 0, 0], tris[k, 0, 1], tris[k, 0, 2],
+                         tris[k, 1, 0], tris[k, 1, 1], tris[k, 1, 2],
+                         tris[k, 2, 0], tris[k, 2, 1], tris[k, 2, 2])
+
+def ray_triangle_intersect(orig: Vector, dir: Vector, tri: Triangle) -> float:
+    (v0x, v0y, v0z), (v1x, v1y, v1z), (v2x, v2y, v2z) = np.asarray(tri, dtype=np.float32)
+    ox, oy, oz = np.asarray(orig, dtype=np.float32)
+    dx, dy, dz = np.asarray(dir, dtype=np.float32)
+    return float(_ray_triangle(ox, oy, oz, dx, dy, dz,
+                               v0x, v0y, v0z, v1x, v1y, v1z, v2x, v2y, v2z))
+
+def _intersect_all(orig: Vector, dir: Vector, v0: np.ndarray, e1: np.ndarray,
+                   e2: np.ndarray) -> np.ndarray:
+    eps = 1e-6
+    h = np.cross(dir, e2)
+    a = np.einsum('ij,ij->i', e1, h)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f = 1.0 / a
+        s = orig - v0
+        u = f * np.einsum('ij,ij->i', s, h)
+        q = np.cross(s, e1)
+        v = f * (q @ dir)
+        t = f * np.einsum('ij,ij->i', e2, q)
+        hit = (np.abs(a) >= eps) & (u >= 0.0) & (u <= 1.0) & (v >= 0.0) & (u + v <= 1.0) & (t > eps)
+    return np.where(hit, t, np.inf)
+
+def ray_triangles_intersect(orig: Vector, dir: Vector, tris: Triangles) -> np.ndarray:
+    """Distances along one ray to every triangle of a (T, 3, 3) array, inf on a miss."""
+    tris = _triangle_array(tris)
+    v0 = tris[:, 0]
+    return _intersect_all(np.asarray(orig, dtype=np.float32), np.asarray(dir, dtype=np.float32),
+                          v0, tris[:, 1] - v0, tris[:, 2] - v0)
+
+def _grid_entries(c0: np.ndarray, span: np.ndarray, n: int, first: int, last: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Cells overlapped by triangles first..last-1 and the triangle of each entry, in triangle order."""
+    c0, span = c0[first:last], span[first:last]
+    per_tri = span[:, 0] * span[:, 1]
+    local = np.repeat(np.arange(last - first, dtype=np.int32), per_tri)
+    offset = np.arange(len(local), dtype=np.int32) - np.repeat(np.cumsum(per_tri, dtype=np.int32) - per_tri, per_tri)
+    width = span[local, 0]
+    cells = (c0[local, 0] + offset % width) * n + c0[local, 1] + offset // width
+    return cells, local + np.int32(first)
+
+def build_grid(tris: np.ndarray, tris_per_cell: float = 4.0, chunk: int = 1 << 20) -> Grid:
+    """Bucket an (T, 3, 3) triangle array into a uniform grid by xy bounding box.
+
+    Triangles are counting sorted into their cells in chunks of about ``chunk``
+    grid entries, so only ``items`` itself grows with the size of the mesh.
+    """
+    count = len(tris)
+    if count == 0:
+        zero = np.zeros(3)
+        return Grid(zero, zero, np.ones(2), np.ones(2, dtype=np.int64),
+                    np.zeros(2, dtype=np.int64), np.zeros(0, dtype=np.int32))
+    bmin = np.minimum(np.minimum(tris[:, 0], tris[:, 1]), tris[:, 2])
+    bmax = np.maximum(np.maximum(tris[:, 0], tris[:, 1]), tris[:, 2])
+    lo, hi = bmin.min(axis=0), bmax.max(axis=0)
+    pad = 1e-4 * max(float(hi.max() - lo.min()), 1.0)
+    lo, hi = lo - pad, hi + pad
+    n = max(1, int(math.sqrt(count / tris_per_cell)))
+    dims = np.array([n, n], dtype=np.int64)
+    cell = (hi[:2] - lo[:2]) / n
+
+    c0 = np.clip((bmin[:, :2] - pad - lo[:2]) // cell, 0, n - 1).astype(np.int32)
+    del bmin
+    span = np.clip((bmax[:, :2] + pad - lo[:2]) // cell, 0, n - 1).astype(np.int32)
+    del bmax
+    span -= c0 - 1
+    ends = np.cumsum(span[:, 0].astype(np.int64) * span[:, 1])
+    # triangle ranges holding about ``chunk`` entries each
+    bounds = np.unique(np.concatenate([
+        [0], np.searchsorted(ends, np.arange(chunk, ends[-1], chunk), side="right"), [count]]))
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+
+    start = np.zeros(n * n + 1, dtype=np.int64)
+    for first, last in chunks:
+        start[1:] += np.bincount(_grid_entries(c0, span, n, first, last)[0], minlength=n * n)
+    np.cumsum(start, out=start)
+    items = np.empty(int(ends[-1]), dtype=np.int32)
+    fill = start[:-1].copy()
+    for first, last in chunks:
+        cells, tri_ids = _grid_entries(c0, span, n, first, last)
+        # stable, so triangles keep their input order inside each cell
+        order = np.argsort(cells, kind="stable")
+        cells = cells[order]
+        counts = np.bincount(cells, minlength=n * n)
+        rank = np.arange(len(cells)) - (np.cumsum(counts) - counts)[cells]
+        items[fill[cells] + rank] = tri_ids[order]
+        fill += counts
+    return Grid(lo, hi, cell, dims, start, items)
+
+@njit(cache=True, fastmath=_FASTMATH)
+def _slab(o: float, d: float, lo: float, hi: float, t0: float, t1: float) -> Tuple[float, float]:
+    if d == 0.0:
+        if o < lo or o > hi:
+            return 1.0, 0.0
+        return t0, t1
+    ta, tb = (lo - o) / d, (hi - o) / d
+    if ta > tb:
+        ta, tb = tb, ta
+    return max(t0, ta), min(t1, tb)
+
+@njit(cache=True, fastmath=_FASTMATH)
+def _dda_start(ox: float, oy: float, oz: float, dx: float, dy: float, dz: float,
+               t_max: float, lo: np.ndarray, hi: np.ndarray, cell: np.ndarray,
+               dims: np.ndarray):
+    """Clip the ray to the mesh bounds and set up the 2D DDA cell walk.
+
+    Returns ``(inside, t1, ix, iy, step_x, next_x, delta_x, step_y, next_y,
+    delta_y)``; ``inside`` is False when the ray misses the bounds.
+    """
+    t0, t1 = _slab(ox, dx, lo[0], hi[0], 0.0, t_max)
+    t0, t1 = _slab(oy, dy, lo[1], hi[1], t0, t1)
+    t0, t1 = _slab(oz, dz, lo[2], hi[2], t0, t1)
+    if t0 > t1:
+        return False, t1, 0, 0, 0, math.inf, math.inf, 0, math.inf, math.inf
+
+    ix = min(max(int(math.floor((ox + dx * t0 - lo[0]) / cell[0])), 0), dims[0] - 1)
+    iy = min(max(int(math.floor((oy + dy * t0 - lo[1]) / cell[1])), 0), dims[1] - 1)
+    step_x, next_x, delta_x = 0, math.inf, math.inf
+    if dx > 0.0:
+        step_x, next_x, delta_x = 1, (lo[0] + (ix + 1) * cell[0] - ox) / dx, cell[0] / dx
+    elif dx < 0.0:
+        step_x, next_x, delta_x = -1, (lo[0] + ix * cell[0] - ox) / dx, -cell[0] / dx
+    step_y, next_y, delta_y = 0, math.inf, math.inf
+    if dy > 0.0:
+        step_y, next_y, delta_y = 1, (lo[1] + (iy + 1) * cell[1] - oy) / dy, cell[1] / dy
+    elif dy < 0.0:
+        step_y, next_y, delta_y = -1, (lo[1] + iy * cell[1] - oy) / dy, -cell[1] / dy
+    return True, t1, ix, iy, step_x, next_x, delta_x, step_y, next_y, delta_y
+
+@njit(cache=True, fastmath=_FASTMATH)
+def _dda_step(ix: int, iy: int, step_x: int, next_x: float, delta_x: float,
+              step_y: int, next_y: float, delta_y: float, dims: np.ndarray):
+    """Move to the next cell along the ray, returns ``(inside, ix, iy, next_x, next_y)``."""
+    if next_x < next_y:
+        ix += step_x
+        next_x += delta_x
+    else:
+        iy += step_y
+        next_y += delta_y
+    inside = 0 <= ix < dims[0] and 0 <= iy < dims[1]
+    return inside, ix, iy, next_x, next_y
+
+@njit(cache=True, fastmath=_FASTMATH)
+def _trace(ox: float, oy: float, oz: float, dx: float, dy: float, dz: float,
+           t_max: float, any_hit: bool, tris: np.ndarray, lo: np.ndarray, hi: np.ndarray,
+           cell: np.ndarray, dims: np.ndarray, start: np.ndarray,
+           items: np.ndarray) -> Tuple[float, int]:
+    """Nearest hit closer than ``t_max`` by walking the grid cells along the ray (2D DDA).
+
+    Returns ``(t, index)`` with index -1 on a miss; with ``any_hit`` the first
+    hit found is returned instead of the nearest.
+    """
+    nearest_t, nearest = t_max, -1
+    inside, t1, ix, iy, step_x, next_x, delta_x, step_y, next_y, delta_y = _dda_start(
+        ox, oy, oz, dx, dy, dz, t_max, lo, hi, cell, dims)
+    while inside:
+        c = ix * dims[1] + iy
+        for m in range(start[c], start[c + 1]):
+            k = items[m]
+            t = _intersect(ox, oy, oz, dx, dy, dz, tris, k)
+            if t < nearest_t:
+                nearest_t, nearest = t, k
+                if any_hit:
+                    return nearest_t, nearest
+        t_exit = min(next_x, next_y)
+        # a hit inside this cell cannot be beaten by triangles further along
+        if nearest_t <= t_exit or t_exit > t1:
+            break
+        inside, ix, iy, next_x, next_y = _dda_step(
+            ix, iy, step_x, next_x, delta_x, step_y, next_y, delta_y, dims)
+    return nearest_t, nearest
+
+@njit(cache=True, fastmath=_FASTMATH, parallel=True)
+def _shadow_kernel(tris: np.ndarray, lo: np.ndarray, hi: np.ndarray, cell: np.ndarray,
+                   dims: np.ndarray, start: np.ndarray, items: np.ndarray,
+                   lx: float, ly: float, lz: float,
+                   plane_z: float, size: float, row0: int, out: np.ndarray) -> None:
+    """Shadow rows ``row0:row0 + len(out)`` of a square image into ``out``."""
+    resolution = out.shape[1]
+    for r in prange(out.shape[0]):
+        iy = row0 + r
         y = (iy / (resolution - 1) - 0.5) * size
         for ix in range(resolution):
             x = (ix / (resolution - 1) - 0.5) * size
-            target = np.array([x, y, plane_z])
-            dir = target - light
+            dx, dy, dz = x - lx, y - ly, plane_z - lz
+            dist = math.sqrt(dx * dx + dy * dy + dz * dz)
+            hit = _trace(lx, ly, lz, np.float32(dx / dist), np.float32(dy / dist),
+                         np.float32(dz / dist), dist, True,
+                         tris, lo, hi, cell, dims, start, items)[1]
+            if hit >= 0:
+                out[r, ix] = 0
+
+@njit(cache=True, fastmath=_FASTMATH, parallel=True)
+def _render_kernel(tris: np.ndarray, lo: np.ndarray, hi: np.ndarray, cell: np.ndarray,
+                   dims: np.ndarray, start: np.ndarray, items: np.ndarray,
+                   lx: float, ly: float, lz: float,
+                   ox: float, oy: float, oz: float, screen_dist: float,
+                   row0: int, out: np.ndarray) -> None:
+    """Render rows ``row0:row0 + len(out)`` of a square image into ``out``."""
+    resolution = out.shape[1]
+    for r in prange(out.shape[0]):
+        iy = row0 + r
+        py = 1 - 2 * (iy + 0.5) / resolution
+        for ix in range(resolution):
+            px = 2 * (ix + 0.5) / resolution - 1
+            norm = math.sqrt(px * px + py * py + screen_dist * screen_dist)
+            # camera looking along -z
+            dx = np.float32(px / norm)
+            dy = np.float32(py / norm)
+            dz = np.float32(-screen_dist / norm)
+            nearest_t, nearest = _trace(ox, oy, oz, dx, dy, dz, math.inf, False,
+                                        tris, lo, hi, cell, dims, start, items)
+            if nearest < 0:
+                continue
+            v0x, v0y, v0z = tris[nearest, 0, 0], tris[nearest, 0, 1], tris[nearest, 0, 2]
+            e1x, e1y, e1z = tris[nearest, 1, 0] - v0x, tris[nearest, 1, 1] - v0y, tris[nearest, 1, 2] - v0z
+            e2x, e2y, e2z = tris[nearest, 2, 0] - v0x, tris[nearest, 2, 1] - v0y, tris[nearest, 2, 2] - v0z
+            nx = e1y * e2z - e1z * e2y
+            ny = e1z * e2x - e1x * e2z
+            nz = e1x * e2y - e1y * e2x
+            n_len = math.sqrt(nx * nx + ny * ny + nz * nz)
+            if n_len == 0.0:
+                n_len = 1.0
+            wx = lx - (ox + dx * nearest_t)
+            wy = ly - (oy + dy * nearest_t)
+            wz = lz - (oz + dz * nearest_t)
+            w_len = math.sqrt(wx * wx + wy * wy + wz * wz)
+            intensity = (nx * wx + ny * wy + nz * wz) / (n_len * w_len)
+            if intensity > 0.0:
+                out[r, ix] = int(255 * intensity)
+
+if HAVE_CUDA:
+    _ray_triangle_device = cuda.jit(device=True)(_ray_triangle.py_func)
+
+    @cuda.jit
+    def _shadow_kernel_cuda(tris: np.ndarray, lx: float, ly: float, lz: float,
+                            plane_z: float, size: float, out: np.ndarray) -> None:
+        """One thread per shadow pixel; each block stages triangles in shared memory."""
+        tile = cuda.shared.array((_CUDA_TILE, 9), dtype=np.float32)
+        ix, iy = cuda.grid(2)
+        tid = cuda.threadIdx.y * cuda.blockDim.x + cuda.threadIdx.x
+        resolution = out.shape[0]
+        inside = ix < resolution and iy < resolution
+        x = (ix / (resolution - 1) - 0.5) * size
+        y = (iy / (resolution - 1) - 0.5) * size
+        dx, dy, dz = x - lx, y - ly, plane_z - lz
+        dist = math.sqrt(dx * dx + dy * dy + dz * dz)
+        dx, dy, dz = np.float32(dx / dist), np.float32(dy / dist), np.float32(dz / dist)
+        blocked = not inside
+        count = tris.shape[0]
+        for base in range(0, count, _CUDA_TILE):
+            # all threads of the block load the tile together
+            if tid < _CUDA_TILE and base + tid < count:
+                for c in range(9):
+                    tile[tid, c] = tris[base + tid, c // 3, c % 3]
+            cuda.syncthreads()
+            if not blocked:
+                for m in range(min(_CUDA_TILE, count - base)):
+                    t = _ray_triangle_device(lx, ly, lz, dx, dy, dz,
+                                             tile[m, 0], tile[m, 1], tile[m, 2],
+                                             tile[m, 3], tile[m, 4], tile[m, 5],
+                                             tile[m, 6], tile[m, 7], tile[m, 8])
+                    if t < dist:
+                        blocked = True
+                        break
+            # the whole block stops loading tiles once every one of its pixels is in shadow
+            if cuda.syncthreads_and(blocked):
+                break
+        if inside and blocked:
+            out[iy, ix] = 0
+
+def _shadow_image_cuda(tris: np.ndarray, lx: float, ly: float, lz: float,
+                       plane_z: float, size: float, out: np.ndarray) -> None:
+    """Run _shadow_kernel_cuda over the whole image, copying the triangles over once."""
+    threads = (_CUDA_BLOCK, _CUDA_BLOCK)
+    blocks = (math.ceil(out.shape[1] / _CUDA_BLOCK), math.ceil(out.shape[0] / _CUDA_BLOCK))
+    d_out = cuda.to_device(out)
+    _shadow_kernel_cuda[blocks, threads](cuda.to_device(tris), lx, ly, lz, plane_z, size, d_out)
+    d_out.copy_to_host(out)
+
+def _candidates(ox: float, oy: float, oz: float, dx: float, dy: float, dz: float,
+                t_max: float, lo: np.ndarray, hi: np.ndarray, cell: np.ndarray,
+                dims: np.ndarray, start: np.ndarray, items: np.ndarray) -> np.ndarray:
+    """Unique triangles in the grid cells the ray crosses inside the mesh bounds."""
+    inside, t1, ix, iy, step_x, next_x, delta_x, step_y, next_y, delta_y = _dda_start(
+        ox, oy, oz, dx, dy, dz, t_max, lo, hi, cell, dims)
+    cells = []
+    while inside:
+        c = ix * dims[1] + iy
+        cells.append(items[start[c]:start[c + 1]])
+        if min(next_x, next_y) > t1:
+            break
+        inside, ix, iy, next_x, next_y = _dda_step(
+            ix, iy, step_x, next_x, delta_x, step_y, next_y, delta_y, dims)
+    if not cells:
+        return items[:0]
+    # triangles spanning several cells would otherwise be tested repeatedly
+    return np.unique(np.concatenate(cells))
+
+def _edges(tris: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    v0 = tris[:, 0]
+    return v0, tris[:, 1] - v0, tris[:, 2] - v0
+
+def _shadow_kernel_numpy(v0: np.ndarray, e1: np.ndarray, e2: np.ndarray, grid: Grid,
+                         lx: float, ly: float, lz: float, plane_z: float, size: float,
+                         row0: int, out: np.ndarray) -> None:
+    """NumPy version of _shadow_kernel testing each ray against all candidates at once."""
+    resolution = out.shape[1]
+    light = np.array([lx, ly, lz], dtype=np.float32)
+    for r in range(out.shape[0]):
+        y = ((row0 + r) / (resolution - 1) - 0.5) * size
+        for ix in range(resolution):
+            x = (ix / (resolution - 1) - 0.5) * size
+            dir = np.array([x, y, plane_z]) - light
             dist = np.linalg.norm(dir)
-            dir /= dist
-            blocked = False
-            for tri in tris:
-                t = ray_triangle_intersect(light, dir, tri)
-                if t < dist:
-                    blocked = True
-                    break
-            if blocked:
-                img[iy, ix] = 0
+            dir = (dir / dist).astype(np.float32)
+            cand = _candidates(lx, ly, lz, *dir, dist, *grid)
+            t = _intersect_all(light, dir, v0[cand], e1[cand], e2[cand])
+            if (t < dist).any():
+                out[r, ix] = 0
+
+def _render_kernel_numpy(v0: np.ndarray, e1: np.ndarray, e2: np.ndarray, grid: Grid,
+                         lx: float, ly: float, lz: float,
+                         ox: float, oy: float, oz: float, screen_dist: float,
+                         row0: int, out: np.ndarray) -> None:
+    """NumPy version of _render_kernel testing each ray against all candidates at once."""
+    resolution = out.shape[1]
+    light = np.array([lx, ly, lz], dtype=np.float32)
+    orig = np.array([ox, oy, oz], dtype=np.float32)
+    for r in range(out.shape[0]):
+        py = 1 - 2 * (row0 + r + 0.5) / resolution
+        for ix in range(resolution):
+            px = 2 * (ix + 0.5) / resolution - 1
+            dir = np.array([px, py, -screen_dist])  # camera looking along -z
+            dir = (dir / np.linalg.norm(dir)).astype(np.float32)
+            cand = _candidates(ox, oy, oz, *dir, math.inf, *grid)
+            t = _intersect_all(orig, dir, v0[cand], e1[cand], e2[cand])
+            if not t.size or t.min() == math.inf:
+                continue
+            k = cand[t.argmin()]
+            normal = np.cross(e1[k], e2[k])
+            normal = normal / (np.linalg.norm(normal) or 1.0)
+            light_dir = light - (orig + dir * t.min())
+            light_dir /= np.linalg.norm(light_dir)
+            out[r, ix] = int(255 * max(0.0, np.dot(normal, light_dir)))
+
+_worker_job = None
+
+def _init_worker(kernel, args) -> None:
+    global _worker_job
+    _worker_job = kernel, args
+
+def _run_block(row0: int, block: np.ndarray) -> np.ndarray:
+    kernel, args = _worker_job
+    kernel(*args, row0, block)
+    return block
+
+def _run_rows(kernel, args: tuple, out: np.ndarray) -> None:
+    """Run ``kernel`` over all rows of ``out``.
+
+    Compiled kernels already spread rows over threads with prange; the
+    NumPy fallback is split into row blocks for a process pool.
+    """
+    workers = os.cpu_count() or 1
+    if HAVE_NUMBA or workers == 1 or len(out) < 2:
+        kernel(*args, 0, out)
+        return
+    row0s = np.linspace(0, len(out), min(len(out), 4 * workers) + 1).astype(int)
+    blocks = [out[a:b].copy() for a, b in zip(row0s[:-1], row0s[1:])]
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(kernel, args)) as pool:
+        for row0, block in zip(row0s, pool.map(_run_block, row0s[:-1].tolist(), blocks)):
+            out[row0:row0 + len(block)] = block
+
+def _triangle_array(tris: Triangles) -> np.ndarray:
+    return np.ascontiguousarray(np.asarray(tris, dtype=np.float32).reshape(-1, 3, 3))
+
+def _sort_by_distance(tris: np.ndarray, point: np.ndarray) -> np.ndarray:
+    """Triangles reordered by centroid distance from ``point``, nearest first."""
+    centroid = tris.mean(axis=1)
+    return tris[np.argsort(np.linalg.norm(centroid - point, axis=1), kind="stable")]
+
+def make_shadow_image(tris: Triangles, light: Vector, plane_z: float,
+                       size: float, resolution: int, gpu: bool = False) -> Image.Image:
+    """Shadow of the mesh on the plane z = plane_z, on the GPU if ``gpu`` and CUDA is available."""
+    img = np.zeros((resolution, resolution), dtype=np.uint8) + 255
+    tris = _triangle_array(tris)
+    lx, ly, lz = light = np.asarray(light, dtype=np.float32)
+    params = (lx, ly, lz, float(plane_z), float(size))
+    if gpu and HAVE_CUDA and cuda.is_available():
+        # the GPU kernel scans all triangles, testing likely blockers close
+        # to the light first ends most searches early (the grid walk on the
+        # CPU already visits cells front to back)
+        _shadow_image_cuda(_sort_by_distance(tris, light), *params, img)
+        return Image.fromarray(img)
+    grid = build_grid(tris)
+    if HAVE_NUMBA:
+        _run_rows(_shadow_kernel, (tris, *grid, *params), img)
+    else:
+        _run_rows(_shadow_kernel_numpy, (*_edges(tris), grid, *params), img)
     return Image.fromarray(img)
 
-def make_render_image(tris: List[Triangle], light: Vector, camera: Vector,
+def make_render_image(tris: Triangles, light: Vector, camera: Vector,
                       resolution: int, fov: float = math.pi / 3) -> Image.Image:
-    aspect = 1.0
     screen_dist = 1.0 / math.tan(fov / 2.0)
     img = np.zeros((resolution, resolution), dtype=np.uint8)
-    for iy in range(resolution):
-        py = (1 - 2 * (iy + 0.5) / resolution)
-        for ix in range(resolution):
-            px = (2 * (ix + 0.5) / resolution - 1) * aspect
-            dir = np.array([px, py, -screen_dist])
-            dir = dir / np.linalg.norm(dir)
-            dir_world = dir  # camera at origin looking along -z
-            orig = camera
-            nearest_t = math.inf
-            nearest_tri = None
-            for tri in tris:
-                t = ray_triangle_intersect(orig, dir_world, tri)
-                if t < nearest_t:
-                    nearest_t = t
-                    nearest_tri = tri
-            if nearest_tri is not None:
-                point = orig + dir_world * nearest_t
-                normal = np.cross(nearest_tri[1]-nearest_tri[0], nearest_tri[2]-nearest_tri[0])
-                normal = normal / (np.linalg.norm(normal) or 1.0)
-                light_dir = light - point
-                light_dir /= np.linalg.norm(light_dir)
-                intensity = max(0.0, np.dot(normal, light_dir))
-                img[iy, ix] = int(255 * intensity)
+    lx, ly, lz = np.asarray(light, dtype=np.float32)
+    ox, oy, oz = np.asarray(camera, dtype=np.float32)
+    tris = _triangle_array(tris)
+    grid = build_grid(tris)
+    params = (lx, ly, lz, ox, oy, oz, screen_dist)
+    if HAVE_NUMBA:
+        _run_rows(_render_kernel, (tris, *grid, *params), img)
+    else:
+        _run_rows(_render_kernel_numpy, (*_edges(tris), grid, *params), img)
     return Image.fromarray(img)
 
 def verify(stl_path: str, shadow_output: str, render_output: str,
            plane_z: float = 100.0, size: float = 100.0,
-           resolution: int = 256) -> None:
+           resolution: int = 256, gpu: bool = False) -> None:
     tris = load_binary_stl(stl_path)
-    light = np.array([0.0, 0.0, 0.0])
-    cam = np.array([0.0, 0.0, 80.0])
-    shadow = make_shadow_image(tris, light, plane_z, size, resolution)
+    light = np.array([0.0, 0.0, 0.0], dtype=np.float32)
+    cam = np.array([0.0, 0.0, 80.0], dtype=np.float32)
+    shadow = make_shadow_image(tris, light, plane_z, size, resolution, gpu=gpu)
     shadow.save(shadow_output)
     render = make_render_image(tris, light, cam, resolution)
     render.save(render_output)
@@ -118,6 +541,9 @@ if __name__ == '__main__':
     parser.add_argument('--plane_z', type=float, default=100.0)
     parser.add_argument('--size', type=float, default=100.0)
     parser.add_argument('--resolution', type=int, default=256)
+    parser.add_argument('--gpu', action='store_true',
+                        help='trace the shadow with CUDA if available')
     args = parser.parse_args()
     verify(args.stl, args.shadow_output, args.render_output,
-           plane_z=args.plane_z, size=args.size, resolution=args.resolution)
+           plane_z=args.plane_z, size=args.size, resolution=args.resolution,
+           gpu=args.gpu)